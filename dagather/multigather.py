@@ -1,19 +1,17 @@
 from __future__ import annotations
 
 import sys
-from asyncio import wait, Task, create_task, FIRST_COMPLETED, CancelledError
-from collections import defaultdict
+from asyncio import Task, create_task, CancelledError, get_running_loop, wait, FIRST_EXCEPTION, Future
+from collections import defaultdict, OrderedDict, deque
 from contextvars import ContextVar
-from functools import partial
-from inspect import signature, Parameter
-from typing import Set, Dict, Callable, overload, TypeVar
+from typing import Set, Dict, Callable, overload, TypeVar, NamedTuple, Tuple, Optional, Any, List, Deque
 
 from dagather.sibling_tasks import SiblingTasks
 from dagather.exceptions import CycleError
 from dagather.result import DagatherResult
-from dagather.tasktemplate import TaskTemplate, ExceptionHandler, CancelPolicy, PropagateError, ContinueResult, \
-    PostErrorResult
-from dagather.util import remove_keys_transitively, filter_dict
+from dagather.tasktemplate import TaskTemplate, ExceptionHandler, CancelPolicy, PropagateError, OUTCOME_PROPAGATE, \
+    Outcome
+from dagather.util import discard_transitively, parameter_names
 
 if sys.version_info < (3, 9, 0):
     def cancel_task(task, msg):
@@ -29,12 +27,38 @@ if sys.version_info < (3, 8, 0):
     def create_task(coro, *, name=None):
         return _ct(coro)
 
-param_kind_ignore = frozenset((
-    Parameter.POSITIONAL_ONLY, Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD
-))
+if sys.version_info < (3, 12, 0):
+    # eager task execution is only available from 3.12
+    create_eager_task = create_task
+else:
+    def create_eager_task(coro, *, name=None):
+        return Task(coro, loop=get_running_loop(), name=name, eager_start=True)
 
 T = TypeVar('T')
 
+
+class _Plan(NamedTuple):
+    """
+    The precomputed structure of a dagather's templates, shared between calls
+    """
+    # all the sequences in the plan are indexed by the templates' indices
+    templates: Tuple[TaskTemplate, ...]
+    # all the templates, in registration order
+    roots: Tuple[TaskTemplate, ...]
+    # all the templates without dependencies, in registration order
+    dependants: Tuple[Tuple[int, ...], ...]
+    # the indices of all the templates that depend directly on each template
+    dep_counts: Tuple[int, ...]
+    # the number of dependencies of each template
+    dep_indices: Tuple[Tuple[int, ...], ...]
+    # the indices of the dependencies of each template, in the same order as the template's dependencies
+    positional_slots: Tuple[Optional[Tuple[int, ...]], ...]
+    # the indices of the dependencies of each template, in the order of the callback's leading positional parameters,
+    # or None if the dependencies cannot all be passed positionally
+    independent: bool
+    # whether no template depends on any other template
+
+
 sibling_tasks: ContextVar[SiblingTasks] = ContextVar('sibling_tasks')
 """
 A context variable to store all the tasks currently running or completed in a single Dagather run
@@ -46,16 +70,46 @@ class Dagather:
     A collection of tasks templates.
     """
 
-    def __init__(self, default_exception_handler: ExceptionHandler = PropagateError):
+    def __init__(self, default_exception_handler: ExceptionHandler = PropagateError, eager_start: bool = False,
+                 memoize: Optional[int] = None, inline_single: bool = False):
         """
         :param default_exception_handler: The default exception handler for new task templates
+        :param eager_start: If true, tasks will be started eagerly, running synchronously until their first suspension
+            as soon as they are created. This can speed up tasks that often finish without awaiting anything. Only
+            effective in python 3.12 and above.
+        :param memoize: If set, the results of up to this many successful calls will be stored, and returned
+            immediately if the dagather is called again with equal arguments. Only calls with hashable arguments are
+            memoized.
+        :param inline_single: If true, a dagather with only a single task template will run it in the calling task,
+            instead of creating a new task for it.
+
+        .. note::
+            Sibling tasks that are started eagerly might observe later tasks as waiting, even if they could have been
+            started.
+
+        .. note::
+            Memoization assumes that all the templates' results depend only on their arguments. Call
+            :meth:`invalidate` to clear the memoized results.
+
+        .. note::
+            A template that runs in the calling task will have its exception handler handle the cancellation of the
+            calling task, and it will not appear as a sibling task.
         """
         self._kwarg_users: Dict[str, Set[TaskTemplate]] = defaultdict(set)
         # maps parameter names to templates that use them. For use for when new subtasks are added,
         # and we want to assign dependencies. parameters that are templates names will not appear here.
         self._templates: Dict[str, TaskTemplate] = {}
         # a mapping of templates by their names
+        self._dependants: Dict[TaskTemplate, List[TaskTemplate]] = {}
+        # a mapping of all templates to all other templates that depend on them directly
         self.default_exception_handler = default_exception_handler
+        self.eager_start = eager_start
+        self.inline_single = inline_single
+        self._plan: Optional[_Plan] = None
+        # the cached plan of the templates, reset whenever a template is registered
+        self.memoize = memoize
+        self._memo: OrderedDict[Any, DagatherResult] = OrderedDict()
+        # the memoized results, from least to most recently used
 
     @overload
     def register(self, func: Callable[..., T], **kwargs) -> TaskTemplate[T]:
@@ -65,19 +119,24 @@ class Dagather:
     def register(self, **kwargs) -> Callable[..., TaskTemplate]:
         pass
 
-    def register(self, func: Callable = ..., exception_handler: ExceptionHandler = ...):
+    def register(self, func: Callable = ..., exception_handler: ExceptionHandler = ..., cache: bool = False):
         """
         Create a new task template, and register it to the dagather.
-        :param func: The callable to wrap in a TaskTemplate. If missing, a partial function is returned.
+        :param func: The callable to wrap in a TaskTemplate. If missing, a decorator is returned.
         :param exception_handler: The exception handler of the task template, default value is to use the
             dagather's default exception handler.
+        :param cache: Whether the task template should cache its results by its arguments (including the results of
+            its dependencies). Only calls with hashable arguments are cached.
         :return: The task template.
 
         .. note::
             This method can be used as a decorator.
         """
         if func is ...:
-            return partial(self.register, exception_handler=exception_handler)
+            def decorator(func):
+                return self.register(func, exception_handler=exception_handler, cache=cache)
+
+            return decorator
         name = func.__name__
 
         if exception_handler is ...:
@@ -88,30 +147,86 @@ class Dagather:
 
         # split keyword arguments into parent template and potential future parent subtasks
         kwargs = set()
-        dependencies = set()
+        dependencies = []
 
-        sign = signature(func)
-        for param in sign.parameters.values():
-            if param.kind in param_kind_ignore:
-                continue
-            parent_task = self._templates.get(param.name)
+        param_names, positional_names = parameter_names(func)
+        for param_name in param_names:
+            parent_task = self._templates.get(param_name)
             if parent_task:
-                dependencies.add(parent_task)
+                dependencies.append(parent_task)
             else:
-                kwargs.add(param.name)
+                kwargs.add(param_name)
 
-        template = TaskTemplate(name, func, dependencies, exception_handler=exception_handler)
+        template = TaskTemplate(name, func, dependencies, exception_handler=exception_handler, cacheable=cache)
+        template._idx = len(self._templates)
+        template._positional_names = tuple(positional_names)
+        self._plan = None
+        self._memo.clear()
         self._templates[name] = template
+        self._dependants[template] = []
+        for dependency in dependencies:
+            self._dependants[dependency].append(template)
         for kw in kwargs:
             self._kwarg_users[kw].add(template)
 
         # any previous template that use the current template as a keyword will now use it as a dependency
         dependants = self._kwarg_users.pop(name, ())
         for dependant in dependants:
-            dependant.dependencies.add(template)
+            dependant.dependencies += (template,)
+            dependant._dep_names += (name,)
+            self._dependants[template].append(dependant)
 
         return template
 
+    def invalidate(self):
+        """
+        Clear all memoized results, including the cached results of all task templates
+        """
+        self._memo.clear()
+        for template in self._templates.values():
+            template.clear_cache()
+
+    def _build_plan(self) -> _Plan:
+        templates = tuple(self._templates.values())
+        roots = tuple(st for st in templates if not st.dependencies)
+        dependants = tuple(tuple(d._idx for d in self._dependants[st]) for st in templates)
+        dep_counts = tuple(len(st.dependencies) for st in templates)
+
+        # run through the templates in topological order once, to make sure there are no cycles
+        not_ready = list(dep_counts)
+        ready = [st._idx for st in roots]
+        visited = 0
+        while ready:
+            visited += 1
+            for dependant in dependants[ready.pop()]:
+                not_ready[dependant] -= 1
+                if not not_ready[dependant]:
+                    ready.append(dependant)
+        if visited != len(templates):
+            raise CycleError(f"cyclic dependancy between multiple subtasks: "
+                             f"{[st for (st, w) in zip(templates, not_ready) if w]}")
+
+        return _Plan(
+            templates=templates,
+            roots=roots,
+            dependants=dependants,
+            dep_counts=dep_counts,
+            dep_indices=tuple(tuple(d._idx for d in st.dependencies) for st in templates),
+            positional_slots=tuple(self._positional_slots(st) for st in templates),
+            independent=not any(dep_counts)
+        )
+
+    @staticmethod
+    def _positional_slots(st: TaskTemplate) -> Optional[Tuple[int, ...]]:
+        dep_count = len(st.dependencies)
+        leading = st._positional_names[:dep_count]
+        if not dep_count or len(leading) < dep_count:
+            return None
+        indices = {d.name: d._idx for d in st.dependencies}
+        if indices.keys() != set(leading):
+            return None
+        return tuple(indices[name] for name in leading)
+
     async def __call__(self, *args, **kwargs) -> DagatherResult:
         """
         Call all the task templates in topological order
@@ -120,101 +235,225 @@ class Dagather:
         :return: a dict, mapping completed task templates to their result value, or their raised exception,
          if an exception was raised.
         """
-        delayed_exception = None
-        intermediary = {}
-
+        if not self.memoize:
+            return await self._call(args, kwargs)
+
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            ret = self._memo.get(key)
+        except TypeError:
+            # unhashable arguments are never memoized
+            return await self._call(args, kwargs)
+        if ret is not None:
+            self._memo.move_to_end(key)
+            return ret
+
+        ret = self._memo[key] = await self._call(args, kwargs)
+        if len(self._memo) > self.memoize:
+            self._memo.popitem(last=False)
+        return ret
+
+    async def _call(self, args, kwargs) -> DagatherResult:
         bad_keys = kwargs.keys() & self._templates.keys()
         if bad_keys:
             raise TypeError(f'cannot accept keywords arguments of subtask names {list(bad_keys)}')
 
+        plan = self._plan
+        if plan is None:
+            plan = self._plan = self._build_plan()
+
+        if plan.independent:
+            if self.inline_single and len(plan.roots) == 1:
+                return await self._call_inline(plan, args, kwargs)
+            return await self._call_independent(plan, args, kwargs)
+
+        delayed_exception = None
+        templates = plan.templates
+        dependants = plan.dependants
+        dep_indices = plan.dep_indices
+        positional_slots = plan.positional_slots
+
+        spawn = create_eager_task if self.eager_start else create_task
+
+        done_tasks: Deque[Task] = deque()
+        # all created tasks push themselves here when they complete
+        waiter: Optional[Future] = None
+        # a future to wake up the scheduler when a task completes, set only while the scheduler is waiting
+
+        def on_done(task: Task):
+            done_tasks.append(task)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
         # helper function to create a task from a template
         def mk_task(st: TaskTemplate):
-            kw = {**filter_dict(intermediary, (d.name for d in st.dependencies)), **kwargs}
-            coroutine = st._safe_call(args, kw)
-            task = create_task(
+            st_positional_slots = positional_slots[st._idx]
+            if st_positional_slots is not None and not args:
+                # the dependencies are exactly the leading parameters, so they can be passed positionally, and the
+                # kwargs can be passed as they are
+                coroutine = st._safe_call(tuple(map(get_intermediary, st_positional_slots)), kwargs, outcomes)
+            else:
+                st_dep_indices = dep_indices[st._idx]
+                if st_dep_indices:
+                    kw = dict(zip(st._dep_names, map(get_intermediary, st_dep_indices)))
+                    # dependency names never collide with kwargs, so the kwargs can be added in one go
+                    kw.update(kwargs)
+                else:
+                    # the kwargs are unpacked when the callback is called, so there is no need to copy them
+                    kw = kwargs
+                coroutine = st._safe_call(args, kw, outcomes)
+            task = spawn(
                 coroutine,
                 name=st.name
             )
-            tasks[task] = st
+            task._dagather_template = st
+            task.add_done_callback(on_done)
             inv_tasks[st] = task
             return task
 
-        tasks: Dict[Task, TaskTemplate] = {}
-        # mapping created tasks to their original template
         inv_tasks: Dict[TaskTemplate, Task] = {}
+        # mapping templates to their created tasks, each task also stores its template
+        intermediary: List[Any] = [None] * len(templates)
+        # the results of all completed templates that have dependants
+        get_intermediary = intermediary.__getitem__
+        outcomes: List[Optional[Outcome]] = [None] * len(templates)
+        # the outcomes of all failed templates, filled by the templates themselves
+
+        remaining = 0
+        # the number of currently running tasks
+        not_ready: List[int] = list(plan.dep_counts)
+        # the number of tasks each template is still waiting for, or 0 if the template is not waiting
+        discarded: Set[int] = set()
+        # the indices of all the discarded templates
+
+        sibling_tasks.set(SiblingTasks(templates, inv_tasks, not_ready, discarded, dependants))
+
+        for st in plan.roots:
+            mk_task(st)
+            remaining += 1
+
+        loop = get_running_loop()
+        while remaining:
+            if not done_tasks:
+                waiter = loop.create_future()
+                try:
+                    await waiter
+                except CancelledError:
+                    for task in inv_tasks.values():
+                        cancel_task(task, 'cancelled by caller')
+                    raise
+                waiter = None
+            done = done_tasks.popleft()
+            remaining -= 1
+
+            st = done._dagather_template
+
+            outcome = outcomes[st._idx]
+            if outcome is None:
+                result = done.result()
+            else:
+                tag, result, cancel_policy = outcome
+                if cancel_policy <= CancelPolicy.discard_not_started:
+                    # either cancel_all or discard_not_started
+                    for idx, waiting_for in enumerate(not_ready):
+                        if waiting_for:
+                            not_ready[idx] = 0
+                            discarded.add(idx)
+                    if cancel_policy is CancelPolicy.cancel_all:
+                        for task in inv_tasks.values():
+                            cancel_task(task, f'cancelled by sibling task "{st.name}"')
+                elif cancel_policy is CancelPolicy.discard_children:
+                    discard_transitively(not_ready, dependants, st._idx, discarded)
+
+                if tag == OUTCOME_PROPAGATE and not delayed_exception:
+                    delayed_exception = result
+
+            st_dependants = dependants[st._idx]
+            if st_dependants:
+                # the results are only needed to call the dependants, the returned result reads from the tasks
+                intermediary[st._idx] = result
+
+            for dependant in st_dependants:
+                waiting_for = not_ready[dependant]
+                if not waiting_for:
+                    # the template may have been removed by another cancelled task
+                    continue
+                not_ready[dependant] = waiting_for - 1
+                if waiting_for == 1:
+                    mk_task(templates[dependant])
+                    remaining += 1
+
+        if delayed_exception:
+            raise delayed_exception
+        return DagatherResult(inv_tasks, {templates[i] for i in discarded} if discarded else frozenset())
 
-        pending: Set[Task] = set()
-        # a set of all currently running templates
-        not_ready: Dict[TaskTemplate, Set[TaskTemplate]] = {}
-        # a mapping of all templates that are waiting for other tasks to complete
-        dependants: Dict[TaskTemplate, Set[TaskTemplate]] = defaultdict(set)
-        # a mapping of all templates to all other subtasks that *might* be waiting for them directly
-        discarded: Set[TaskTemplate] = set()
-        # a collection of all the discarded tasks
+    async def _call_inline(self, plan: _Plan, args, kwargs) -> DagatherResult:
+        """
+        Call the only task template directly in the calling task
+        """
+        st, = plan.roots
+        # all dependency counts are 0, so nothing can be discarded and the counts are never modified
+        sibling_tasks.set(SiblingTasks(plan.templates, {}, plan.dep_counts, frozenset(), plan.dependants))
 
-        sibling_tasks.set(SiblingTasks(inv_tasks, not_ready, discarded, dependants))
+        outcomes: List[Optional[Outcome]] = [None]
+        ret = await st._safe_call(args, kwargs, outcomes)
+        outcome, = outcomes
+        if outcome is not None and outcome[0] == OUTCOME_PROPAGATE:
+            raise outcome[1]
 
-        for st in self._templates.values():
-            for dependancy in st.dependencies:
-                dependants[dependancy].add(st)
+        done = get_running_loop().create_future()
+        done.set_result(ret)
+        return DagatherResult({st: done}, frozenset())
 
-            if not st.dependencies:
-                pending.add(mk_task(st))
-            else:
-                not_ready[st] = set(st.dependencies)
+    async def _call_independent(self, plan: _Plan, args, kwargs) -> DagatherResult:
+        """
+        Call all the task templates at once, for when no template depends on another. Since no task ever waits, there
+        is nothing to discard, and the only special handling needed is for cancelling all tasks.
+        """
+        delayed_exception = None
+
+        spawn = create_eager_task if self.eager_start else create_task
 
-        while True:
-            if not pending:
-                if not_ready:
-                    raise CycleError(f"cyclic dependancy between multiple subtasks: {list(not_ready)}")
-                break
+        inv_tasks: Dict[TaskTemplate, Task] = {}
+        # mapping templates to their created tasks
+        outcomes: List[Optional[Outcome]] = [None] * len(plan.templates)
+        # the outcomes of all failed templates, filled by the templates themselves
+        # all dependency counts are 0, so nothing can be discarded and the counts are never modified
+        sibling_tasks.set(SiblingTasks(plan.templates, inv_tasks, plan.dep_counts, frozenset(), plan.dependants))
+
+        def on_done(done: Task):
+            nonlocal delayed_exception
+            outcome = outcomes[done._dagather_template._idx]
+            if outcome is not None:
+                tag, result, cancel_policy = outcome
+                if cancel_policy is CancelPolicy.cancel_all:
+                    for task in inv_tasks.values():
+                        cancel_task(task, f'cancelled by sibling task "{done._dagather_template.name}"')
+                if tag == OUTCOME_PROPAGATE and not delayed_exception:
+                    delayed_exception = result
+
+        for st in plan.roots:
+            # the kwargs are unpacked when the callback is called, so there is no need to copy them
+            task = spawn(
+                st._safe_call(args, kwargs, outcomes),
+                name=st.name
+            )
+            task._dagather_template = st
+            task.add_done_callback(on_done)
+            inv_tasks[st] = task
 
+        if inv_tasks:
             try:
-                # pytype: disable=annotation-type-mismatch #in future versions, pending will 100% return tasks
-                done_tasks, pending = await wait(pending, return_when=FIRST_COMPLETED)
-                # pytype: enable=annotation-type-mismatch
+                done_tasks, _ = await wait(inv_tasks.values(), return_when=FIRST_EXCEPTION)
             except CancelledError:
-                for task in tasks:
+                for task in inv_tasks.values():
                     cancel_task(task, 'cancelled by caller')
                 raise
-
-            done: Task
-            for done in done_tasks:
-                st = tasks[done]
-
-                result = done.result()
-
-                if isinstance(result, PostErrorResult):
-                    if result.cancel_policy is CancelPolicy.cancel_all:
-                        discarded.update(not_ready)
-                        not_ready.clear()
-                        for task in tasks:
-                            cancel_task(task, f'cancelled by sibling task "{st.name}"')
-                    elif result.cancel_policy is CancelPolicy.discard_not_started:
-                        discarded.update(not_ready)
-                        not_ready.clear()
-                    elif result.cancel_policy is CancelPolicy.discard_children:
-                        remove_keys_transitively(not_ready, dependants, st, discarded)
-
-                    if isinstance(result, PropagateError):
-                        if not delayed_exception:
-                            delayed_exception = result.exception
-                        result = result.exception
-                    else:
-                        assert isinstance(result, ContinueResult)
-                        result = result.return_value
-
-                intermediary[st.name] = result
-
-                for dependant in dependants[st]:
-                    if dependant not in not_ready:
-                        # the template may have been removed by another cancelled task
-                        continue
-                    not_ready[dependant].remove(st)
-                    if not not_ready[dependant]:
-                        del not_ready[dependant]
-                        pending.add(mk_task(dependant))
+            for task in done_tasks:
+                # re-raise any error that the exception handlers could not handle, or the cancellation of a task that
+                # was cancelled before it started, like the general path does
+                task.result()
 
         if delayed_exception:
             raise delayed_exception
-        return DagatherResult(inv_tasks, discarded)
+        return DagatherResult(inv_tasks, frozenset())
@@ -1,4 +1,4 @@
-from asyncio import Task
+from asyncio import Future
 from typing import Mapping, Any, Container
 
 from dagather.exceptions import DiscardedTask
@@ -6,7 +6,9 @@ from dagather.tasktemplate import TaskTemplate, ContinueResult
 
 
 class DagatherResult(Mapping[TaskTemplate, Any]):
-    def __init__(self, tasks: Mapping[TaskTemplate, Task], discarded: Container[TaskTemplate]):
+    __slots__ = ('tasks', 'discarded')
+
+    def __init__(self, tasks: Mapping[TaskTemplate, Future], discarded: Container[TaskTemplate]):
         self.tasks = tasks
         self.discarded = discarded
 
@@ -2,11 +2,11 @@ from __future__ import annotations
 
 from asyncio import Task
 from enum import Enum, auto
-from typing import MutableMapping, Any, Mapping, Collection, Optional, MutableSet
+from typing import Mapping, Collection, Optional, MutableSet, Sequence, MutableSequence
 
 from dagather.exceptions import DiscardedTask
 from dagather.tasktemplate import TaskTemplate
-from dagather.util import remove_keys_transitively
+from dagather.util import discard_transitively
 
 
 class SiblingTaskState(Enum):
@@ -17,10 +17,16 @@ class SiblingTaskState(Enum):
 
 
 class SiblingTasks:
-    def __init__(self, created_tasks: MutableMapping[TaskTemplate, Task],
-                 waiting: MutableMapping[TaskTemplate, Any],
-                 discarded: MutableSet[TaskTemplate],
-                 dependency_relation: Mapping[TaskTemplate, Collection[TaskTemplate]]):
+    __slots__ = ('_templates', '_created_tasks', '_waiting', '_discarded', '_dependency_relation')
+
+    def __init__(self, templates: Sequence[TaskTemplate],
+                 created_tasks: Mapping[TaskTemplate, Task],
+                 waiting: MutableSequence[int],
+                 discarded: MutableSet[int],
+                 dependency_relation: Sequence[Collection[int]]):
+        # waiting, discarded and dependency_relation are by the templates' indices. If no template is waiting,
+        # waiting and discarded are never modified, and can be immutable.
+        self._templates = templates
         self._created_tasks = created_tasks
         self._waiting = waiting
         self._discarded = discarded
@@ -37,8 +43,21 @@ class SiblingTasks:
             return SiblingTaskState.done
         return SiblingTaskState.running
 
+    def _index_of(self, key: TaskTemplate) -> Optional[int]:
+        """
+        :return: the index of the template in the current run, or None if the template is not part of it
+        """
+        idx = key._idx
+        # templates of other dagathers can have the same index
+        if 0 <= idx < len(self._templates) and self._templates[idx] is key:
+            return idx
+        return None
+
     def task(self, key: TaskTemplate) -> Optional[Task]:
-        if key in self._discarded:
+        idx = self._index_of(key)
+        if idx is None:
+            return None
+        if idx in self._discarded:
             raise DiscardedTask(f'{key!r} has been discarded')
         return self._created_tasks.get(key)
 
@@ -49,5 +68,7 @@ class SiblingTasks:
         task = self.task(key)
         if task:
             task.cancel()
-        else:
-            remove_keys_transitively(self._waiting, self._dependency_relation, key, self._discarded)
+            return
+        idx = self._index_of(key)
+        if idx is not None:
+            discard_transitively(self._waiting, self._dependency_relation, idx, self._discarded)
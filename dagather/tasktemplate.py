@@ -1,51 +1,111 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from enum import Enum, auto
-from functools import update_wrapper, partial
-from typing import Callable, TypeVar, Generic, Coroutine, Set, Any, Union, Type, Mapping
+from enum import IntEnum
+from functools import partial, lru_cache
+from types import FunctionType
+from weakref import WeakKeyDictionary
+from typing import Callable, TypeVar, Generic, Coroutine, Any, Union, Type, Mapping, Dict, Tuple, Optional, Iterable, \
+    MutableSequence, MutableMapping
 
 
-class CancelPolicy(Enum):
+class CancelPolicy(IntEnum):
     """
     Which templates to cancel if an exception is raised.
+    The policies are ordered from the most to the least disruptive.
     """
-    cancel_all = auto()
+    cancel_all = 1
     """
     Cancel all tasks, causing all started tasks to raise a CancelledError and discarding all others
     """
-    discard_not_started = auto()
+    discard_not_started = 2
     """
     Discard all tasks that have not yet been started.
     """
-    discard_children = auto()
+    discard_children = 3
     """
     Discard all subtasks that rely on the result of the failed task.
     """
-    continue_all = auto()
+    continue_all = 4
     """
     No subtasks are canceled.
     """
 
 
+OUTCOME_PROPAGATE = 1
+OUTCOME_CONTINUE = 2
+
+Outcome = Tuple[int, Any, CancelPolicy]
+"""
+The outcome of a failed task template's call: a tag (one of the OUTCOME_ constants), the result value (or the exception
+to propagate), and the cancel policy
+"""
+
+
+def _as_cancel_policy(cancel_policy) -> CancelPolicy:
+    """
+    :return: the CancelPolicy member equal to cancel_policy. The scheduler checks policies by identity and order, so
+        equal ints are converted to members, and anything else raises a ValueError.
+    """
+    if type(cancel_policy) is CancelPolicy:
+        return cancel_policy
+    return CancelPolicy(cancel_policy)
+
+
 class PostErrorResult:
+    __slots__ = ('cancel_policy',)
     cancel_policy: CancelPolicy
 
     @classmethod
     def exception_handler(cls, cancel_policy: CancelPolicy):
+        """
+        :return: an exception handler that creates a result of this class with the cancel policy. The same handler is
+            returned for equal arguments.
+        """
+        # the policy is converted before caching, since the cache cannot tell CancelPolicy members from equal ints
+        return cls._exception_handler(_as_cancel_policy(cancel_policy))
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def _exception_handler(cls, cancel_policy: CancelPolicy):
         return partial(cls, cancel_policy=cancel_policy)
 
 
-@dataclass
 class ContinueResult(PostErrorResult):
-    return_value: Any
-    cancel_policy: CancelPolicy = CancelPolicy.continue_all
+    __slots__ = ('return_value',)
+
+    def __init__(self, return_value: Any, cancel_policy: CancelPolicy = CancelPolicy.continue_all):
+        self.return_value = return_value
+        self.cancel_policy = _as_cancel_policy(cancel_policy)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return (self.return_value, self.cancel_policy) == (other.return_value, other.cancel_policy)
+
+    def __repr__(self):
+        return f'{type(self).__qualname__}(return_value={self.return_value!r}, cancel_policy={self.cancel_policy!r})'
+
+    def _outcome(self) -> Outcome:
+        return OUTCOME_CONTINUE, self.return_value, self.cancel_policy
 
 
-@dataclass
 class PropagateError(PostErrorResult):
-    exception: BaseException
-    cancel_policy: CancelPolicy = CancelPolicy.cancel_all
+    __slots__ = ('exception',)
+
+    def __init__(self, exception: BaseException, cancel_policy: CancelPolicy = CancelPolicy.cancel_all):
+        self.exception = exception
+        self.cancel_policy = _as_cancel_policy(cancel_policy)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return (self.exception, self.cancel_policy) == (other.exception, other.cancel_policy)
+
+    def __repr__(self):
+        return f'{type(self).__qualname__}(exception={self.exception!r}, cancel_policy={self.cancel_policy!r})'
+
+    def _outcome(self) -> Outcome:
+        return OUTCOME_PROPAGATE, self.exception, self.cancel_policy
 
 
 class Abort(BaseException):
@@ -70,59 +130,238 @@ A protocol for exception handlers, that dictate how subtasks should behave if th
 """
 
 
-def handle_exception(handler: ExceptionHandler, exc: BaseException, base_explicit=False):
-    if isinstance(handler, PostErrorResult):
-        if not base_explicit and not isinstance(exc, Exception):
+_propagate_all = PropagateError.exception_handler(CancelPolicy.cancel_all)
+# the handler factory equivalent to the default handler, the factories are cached so this is the only instance
+
+_HANDLER_POST_ERROR_RESULT = 0
+_HANDLER_CALLABLE = 1
+_HANDLER_MAPPING = 2
+
+_handler_kinds: Dict[type, int] = {
+    partial: _HANDLER_CALLABLE,
+    FunctionType: _HANDLER_CALLABLE,
+    type: _HANDLER_CALLABLE,
+    dict: _HANDLER_MAPPING,
+}
+# the kinds of the most common exception handler types
+_other_handler_kinds: MutableMapping[type, int] = WeakKeyDictionary()
+# the kinds of all other exception handler types, so that each type is checked by isinstance only once. The types are
+# weakly referenced, so that handler types created at runtime can still be released
+
+
+def handle_exception(handler: ExceptionHandler, exc: BaseException, base_explicit=False,
+                     matches: Optional[Dict[type, Any]] = None) -> PostErrorResult:
+    """
+    resolve an exception handler into a post-error result for an exception.
+    :param handler: the handler to resolve
+    :param exc: the exception raised by the task
+    :param base_explicit: whether the handler was explicitly chosen for the exception's type, allowing it to handle
+        exceptions that are not Exceptions
+    :param matches: if given, a cache of the values matched in handler by exception type, used if handler is a
+        mapping. The mapping must never change while the cache is in use.
+    """
+    if handler is PropagateError or handler is _propagate_all:
+        # the default handler, the result is always the same regardless of the exception's type
+        return PropagateError(exc)
+    while True:
+        handler_type = type(handler)
+        if handler_type is PropagateError or handler_type is ContinueResult:
+            # the most common case, where a handler has already resolved to a result
+            return handler if base_explicit or isinstance(exc, Exception) else PropagateError(exc)
+        kind = _handler_kinds.get(handler_type)
+        if kind is None:
+            kind = _other_handler_kinds.get(handler_type)
+        if kind is None:
+            if isinstance(handler, PostErrorResult):
+                kind = _HANDLER_POST_ERROR_RESULT
+            elif callable(handler):
+                kind = _HANDLER_CALLABLE
+            else:
+                kind = _HANDLER_MAPPING
+            # all the checks depend only on the handler's type, so the kind is remembered for the next handlers
+            _other_handler_kinds[handler_type] = kind
+
+        if kind == _HANDLER_POST_ERROR_RESULT:
+            if not base_explicit and not isinstance(exc, Exception):
+                return PropagateError(exc)
+            return handler
+        if kind == _HANDLER_CALLABLE:
+            handler = handler(exc)
+            # the cache is only for the outermost handler, the handlers it resolves to can differ between calls
+            matches = None
+            continue
+        if matches is not None:
+            try:
+                match = matches[type(exc)]
+            except KeyError:
+                match = matches[type(exc)] = _first_match(handler, exc)
+            matches = None
+        else:
+            match = _first_match(handler, exc)
+        if match is _no_match:
             return PropagateError(exc)
-        return handler
-    if callable(handler):
-        return handle_exception(handler(exc), exc, base_explicit)
+        handler = match
+        base_explicit = True
+
+
+_no_match = object()
+
+
+def _first_match(handler: Mapping[Type[BaseException], ExceptionHandler], exc: BaseException):
+    """
+    :return: the value of the first key in handler that exc is an instance of, or _no_match if there is none
+    """
     for k, v in handler.items():
         if isinstance(exc, k):
-            return handle_exception(v, exc, True)
-    return PropagateError(exc)
+            return v
+    return _no_match
 
 
 T = TypeVar('T')
 
 
+class _CallbackAttribute:
+    """
+    A class attribute that is looked up on the callback when accessed through a template, for attributes that cannot
+    be stored in slots since the class itself defines them
+    """
+    __slots__ = ('name', 'class_value')
+
+    def __init__(self, name: str, class_value: Any):
+        self.name = name
+        self.class_value = class_value
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self.class_value
+        return getattr(instance.callback, self.name, None)
+
+
 class TaskTemplate(Generic[T]):
     """
     A template for a sub-task in a dagather instance
     """
+    __slots__ = ('name', 'callback', 'dependencies', '_dep_names', '_positional_names', '_exception_handler',
+                 '_handler_snapshot', '_handler_matches', '_idx', '_cacheable', '_cache', '_safe_call', '__wrapped__',
+                 '__name__', '__qualname__', '__weakref__')
+    __doc__ = _CallbackAttribute('__doc__', __doc__)
 
     def __init__(self, name: str,
                  callback: Callable[..., Coroutine[None, None, T]],
-                 dependencies: Set[TaskTemplate],
-                 exception_handler: ExceptionHandler):
+                 dependencies: Iterable[TaskTemplate],
+                 exception_handler: ExceptionHandler,
+                 cacheable: bool = False):
         """
         :param name: the name of the template
         :param callback: the async function to call when executing the task
-        :param dependencies: a set of task templates that must be completed before this task is started.
+        :param dependencies: the task templates that must be completed before this task is started.
         :param exception_handler: the exception handler to use if the task raises an exception
+        :param cacheable: whether to cache the results of the task by its arguments. Only successful results of calls
+            with hashable arguments are cached.
         """
         self.name = name
         self.callback = callback
-        self.dependencies = dependencies
+        self.dependencies: Tuple[TaskTemplate, ...] = tuple(dependencies)
+        self._dep_names = tuple(d.name for d in self.dependencies)
+        # the names of the dependencies, in the same order, for creating the keyword arguments of the callback
+        self._positional_names: Tuple[str, ...] = ()
+        # the names of the leading parameters the callback accepts positionally, set when the template is registered
         self.exception_handler = exception_handler
-        update_wrapper(self, callback)
+        self._idx = -1
+        # the index of the template in its dagather, set when the template is registered
+        self._cache: Dict[Any, Any] = {}
+        self.cacheable = cacheable
+        self.__wrapped__ = callback
+        self.__name__ = getattr(callback, '__name__', name)
+        self.__qualname__ = getattr(callback, '__qualname__', name)
+
+    @property
+    def exception_handler(self) -> ExceptionHandler:
+        """
+        the exception handler to use if the task raises an exception. If the handler is a mapping, it is copied when
+        assigned, so changes to the mapping only take effect once it is assigned again.
+        """
+        return self._exception_handler
+
+    @exception_handler.setter
+    def exception_handler(self, exception_handler: ExceptionHandler):
+        self._exception_handler = exception_handler
+        self._handler_matches: Optional[Dict[type, Any]]
+        # the values matched in the exception handler by exception type, if the handler is a mapping
+        if isinstance(exception_handler, Mapping) and not callable(exception_handler):
+            # the mapping is copied, so that later changes to it cannot make the cached matches stale
+            self._handler_snapshot = dict(exception_handler)
+            self._handler_matches = {}
+        else:
+            self._handler_snapshot = exception_handler
+            self._handler_matches = None
 
-    async def _safe_call(self, args, kwargs):
+    @property
+    def cacheable(self) -> bool:
+        """
+        whether the template caches its results by its arguments.
+        """
+        return self._cacheable
+
+    @cacheable.setter
+    def cacheable(self, cacheable: bool):
+        self._cacheable = cacheable
+        # the implementation is chosen here, so that uncached calls don't need to check for the cache
+        self._safe_call = self._call_cached if cacheable else self._call_uncached
+
+    async def _call_uncached(self, args, kwargs, outcomes: MutableSequence[Optional[Outcome]]):
         """
         call the inner function while catching any errors and using the template's exception wrapper.
+        :param outcomes: if the call fails, its outcome is stored here, at the template's index
         """
         try:
-            result = await self(*args, **kwargs)
+            result = await self.callback(*args, **kwargs)
         except Abort as e:
-            return e.args[0]
+            post_error_result = e.args[0]
         except BaseException as e:
-            return handle_exception(self.exception_handler, e)
+            post_error_result = handle_exception(self._handler_snapshot, e, matches=self._handler_matches)
+        else:
+            # pytype: disable=name-error
+            if isinstance(result, PostErrorResult):
+                raise TypeError('subtask must not return a PostErrorResult, raise an AbortSubtask instead')
+            return result
+            # pytype: enable=name-error
 
-        # pytype: disable=name-error
-        if isinstance(result, PostErrorResult):
-            raise TypeError('subtask must not return a PostErrorResult, raise an AbortSubtask instead')
+        outcomes[self._idx] = post_error_result._outcome()
+        return post_error_result
+
+    async def _call_cached(self, args, kwargs, outcomes: MutableSequence[Optional[Outcome]]):
+        """
+        call the inner function like _call_uncached, using and populating the template's cache.
+        """
+        key = (args, tuple(sorted(kwargs.items())))
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable arguments are never cached
+            return await self._call_uncached(args, kwargs, outcomes)
+
+        result = await self._call_uncached(args, kwargs, outcomes)
+        if outcomes[self._idx] is None:
+            self._cache[key] = result
         return result
-        # pytype: enable=name-error
+
+    def __getattr__(self, item):
+        """
+        delegate missing attributes to the base callable of the template.
+        """
+        if item == 'callback':
+            # the callback itself is missing, the template is not yet initialized
+            raise AttributeError(item)
+        return getattr(self.callback, item)
+
+    def clear_cache(self):
+        """
+        Clear all the cached results of the template
+        """
+        self._cache.clear()
 
     def __call__(self, *args, **kwargs) -> Coroutine[None, None, T]:
         """
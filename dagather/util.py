@@ -1,20 +1,45 @@
-from typing import Mapping, TypeVar, Dict, Iterable, Collection, Any, MutableMapping, MutableSet
+from inspect import signature, Parameter
+from types import FunctionType
+from typing import Collection, MutableSet, Callable, MutableSequence, Sequence, Tuple
 
-K = TypeVar('K')
-V = TypeVar('V')
 
+def discard_transitively(waiting: MutableSequence[int], relation: Sequence[Collection[int]], seed: int,
+                         discarded_sink: MutableSet[int]):
+    """
+    Stop an index, and all the indices that transitively depend on it, from waiting.
+    :param waiting: the number of items each index is waiting for, or 0 if the index is not waiting
+    :param relation: the indices that depend directly on each index
+    :param seed: the index to discard
+    :param discarded_sink: a set to add all the discarded indices to
+    """
+    stack = [seed]
+    while stack:
+        idx = stack.pop()
+        if waiting[idx]:
+            waiting[idx] = 0
+            discarded_sink.add(idx)
+        stack.extend(c for c in relation[idx] if waiting[c])
 
-def filter_dict(origin: Mapping[K, V], keys: Iterable[K]) -> Dict[K, V]:
-    return {k: origin[k] for k in keys}
 
+param_kind_ignore_mask = (1 << Parameter.POSITIONAL_ONLY) | (1 << Parameter.VAR_POSITIONAL) \
+    | (1 << Parameter.VAR_KEYWORD)
+# a bitmask of the parameter kinds that cannot be passed as keyword arguments
 
-Missing = object()
 
-
-def remove_keys_transitively(d: MutableMapping[K, Any], relation: Mapping[K, Collection[K]], seed: K,
-                             removed_keys_sink: MutableSet[K]):
-    if d.pop(seed, Missing) is not Missing:
-        removed_keys_sink.add(seed)
-    for c in relation[seed]:
-        if c in d:
-            remove_keys_transitively(d, relation, c, removed_keys_sink)
+def parameter_names(func: Callable) -> Tuple[Sequence[str], Sequence[str]]:
+    """
+    :return: the names of all the parameters of func that can be passed as keyword arguments, and the names of the
+        leading parameters of func that can be passed either positionally or as keyword arguments. The second sequence
+        is empty if func has positional-only parameters, or if func is not a plain function, since a reported
+        signature might not match the parameters func actually accepts.
+    """
+    if isinstance(func, FunctionType) and not hasattr(func, '__wrapped__') and not hasattr(func, '__signature__'):
+        # for plain functions, we can read the parameters from the code object, which is much faster than signature.
+        # co_varnames starts with the positional parameters, followed by the keyword-only parameters, and only then
+        # the variadic parameters and the local variables, so slicing it skips everything we ignore
+        code = func.__code__
+        start = getattr(code, 'co_posonlyargcount', 0)
+        names = code.co_varnames
+        return names[start:code.co_argcount + code.co_kwonlyargcount], (names[:code.co_argcount] if not start else ())
+    sign = signature(func)
+    return [param.name for param in sign.parameters.values() if not (param_kind_ignore_mask >> param.kind) & 1], ()
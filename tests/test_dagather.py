@@ -1,9 +1,16 @@
-from asyncio import sleep, CancelledError, wait_for, TimeoutError
+import sys
+from asyncio import sleep, CancelledError, wait_for, TimeoutError, current_task
+from functools import wraps
+from inspect import signature, Signature, Parameter
+from types import MappingProxyType
+from weakref import ref
+from gc import collect
 
-from pytest import mark, raises
+from pytest import mark, raises, fixture
 
 from dagather import Dagather, PropagateError, ContinueResult, CancelPolicy, Abort, sibling_tasks, SiblingTaskState
 from dagather.exceptions import CycleError, DiscardedTask
+from dagather.tasktemplate import handle_exception
 
 atest = mark.asyncio
 
@@ -44,6 +51,121 @@ async def test_seq():
     assert execution_order == ['a', 'b', 'c']
 
 
+@atest
+async def test_register_after_call():
+    dag = Dagather()
+
+    @dag.register
+    async def b(a):
+        return a + 1
+
+    @dag.register
+    async def c(a):
+        return a * 10
+
+    assert await dag(a=1) == {b: 2, c: 10}
+
+    @dag.register
+    async def a():
+        return 5
+
+    assert await dag() == {a: 5, b: 6, c: 50}
+
+
+@atest
+async def test_dependency_order():
+    dag = Dagather()
+
+    @dag.register
+    async def a(x):
+        return x
+
+    @dag.register
+    async def b(x):
+        return x * 2
+
+    @dag.register
+    async def c(b, a, x):
+        return (b, a)
+
+    @dag.register
+    async def d(x, a):
+        return a - x
+
+    @dag.register
+    async def e(a, *args, c, **kwargs):
+        return a, c
+
+    assert await dag(x=3) == {a: 3, b: 6, c: (6, 3), d: 0, e: (3, (6, 3))}
+
+
+@atest
+async def test_memoize():
+    dag = Dagather(memoize=2)
+    calls = []
+
+    @dag.register
+    async def a(x):
+        calls.append(x)
+        return x * 2
+
+    assert await dag(x=1) == {a: 2}
+    assert await dag(x=1) == {a: 2}
+    assert calls == [1]
+
+    assert await dag(x=2) == {a: 4}
+    assert await dag(x=3) == {a: 6}
+    assert await dag(x=1) == {a: 2}
+    assert calls == [1, 2, 3, 1]
+
+    assert await dag(x=[1]) == {a: [1, 1]}
+    assert await dag(x=[1]) == {a: [1, 1]}
+    assert calls == [1, 2, 3, 1, [1], [1]]
+
+    dag.invalidate()
+    assert await dag(x=1) == {a: 2}
+    assert calls == [1, 2, 3, 1, [1], [1], 1]
+
+
+@atest
+async def test_cache():
+    dag = Dagather()
+    calls = []
+
+    @dag.register
+    async def a(x):
+        calls.append('a')
+        return x % 2
+
+    @dag.register(cache=True)
+    async def b(a, x):
+        calls.append('b')
+        return a * 10
+
+    @dag.register(cache=True)
+    async def c(b, x):
+        calls.append('c')
+        raise ValueError
+
+    with raises(ValueError):
+        await dag(x=1)
+    assert calls == ['a', 'b', 'c']
+
+    with raises(ValueError):
+        await dag(x=1)
+    assert calls == ['a', 'b', 'c', 'a', 'c']
+
+    dag.invalidate()
+    with raises(ValueError):
+        await dag(x=1)
+    assert calls == ['a', 'b', 'c', 'a', 'c', 'a', 'b', 'c']
+
+    b.cacheable = False
+    with raises(ValueError):
+        await dag(x=1)
+    assert calls == ['a', 'b', 'c', 'a', 'c', 'a', 'b', 'c', 'a', 'b', 'c']
+
+
 @atest
 async def test_layers():
     dag = Dagather()
@@ -95,9 +217,89 @@ async def test_layers():
     assert execution_order == list('1112233')
 
 
+@atest
+async def test_eager():
+    dag = Dagather(eager_start=True)
+
+    @dag.register
+    async def a():
+        return 1
+
+    @dag.register
+    async def b(a):
+        await sleep(0.01)
+        return a + 1
+
+    @dag.register
+    async def c(a, b):
+        return a + b
+
+    assert await dag() == {a: 1, b: 2, c: 3}
+
+
+@atest
+@mark.skipif(sys.version_info < (3, 12, 0), reason='eager tasks require python 3.12')
+@mark.parametrize('eager_start', [True, False])
+async def test_eager_runs_on_creation(eager_start):
+    dag = Dagather(eager_start=eager_start)
+    ex = []
+
+    @dag.register
+    async def a():
+        # an eager task runs until its first suspension before it is even stored as a created task
+        ex.append(sibling_tasks.get().task(a))
+        return 1
+
+    @dag.register
+    async def b(a):
+        return a + 1
+
+    assert await dag() == {a: 1, b: 2}
+    if eager_start:
+        assert ex == [None]
+    else:
+        assert ex != [None]
+
+
+@atest
+async def test_inline_single():
+    dag = Dagather(inline_single=True)
+    tasks = []
+
+    @dag.register
+    async def a(x):
+        tasks.append(current_task())
+        return x
+
+    assert await dag(x=1) == {a: 1}
+    assert tasks == [current_task()]
+
+    @dag.register(exception_handler=ContinueResult.exception_handler(CancelPolicy.continue_all))
+    async def b(a, x):
+        raise ValueError
+
+    result = await dag(x=2)
+    assert result[a] == 2
+    assert isinstance(result[b], ValueError)
+    assert tasks[1] is not current_task()
+
+
+@atest
+async def test_inline_single_error():
+    dag = Dagather(inline_single=True)
+
+    @dag.register
+    async def a():
+        raise ValueError('foobar')
+
+    with raises(ValueError, match='foobar'):
+        await dag()
+
+
 @atest
 async def test_cyclic():
     dag = Dagather()
+    ex = []
 
     @dag.register
     async def a(b):
@@ -107,9 +309,15 @@ async def test_cyclic():
     async def b(a):
         pass
 
+    @dag.register
+    async def c():
+        ex.append('c')
+
     with raises(CycleError):
         await dag()
 
+    assert ex == []
+
 
 @atest
 async def test_missing_args():
@@ -152,6 +360,87 @@ async def test_args():
     assert await dag(1, 2, z=3) == {a: 7}
 
 
+@atest
+async def test_wrapped():
+    dag = Dagather()
+
+    def logged(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            ex.append(func.__name__)
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+    ex = []
+
+    @dag.register
+    @logged
+    async def a(x, y):
+        return x
+
+    @dag.register
+    @logged
+    async def b(a, *args, x, y, **kwargs):
+        return a + y
+
+    assert await dag(x=1, y=2) == {a: 1, b: 3}
+    assert ex == ['a', 'b']
+
+
+@atest
+async def test_wrapped_keyword_only():
+    dag = Dagather()
+
+    def keyword_only(func):
+        @wraps(func)
+        async def wrapper(**kwargs):
+            return await func(**kwargs)
+
+        return wrapper
+
+    @dag.register
+    async def a():
+        return 1
+
+    @dag.register
+    @keyword_only
+    async def b(a):
+        return a + 1
+
+    async def c(**kwargs):
+        return kwargs['a'] + kwargs['b']
+
+    c.__signature__ = Signature([Parameter('a', Parameter.POSITIONAL_OR_KEYWORD),
+                                 Parameter('b', Parameter.POSITIONAL_OR_KEYWORD)])
+    c = dag.register(c)
+
+    assert await dag() == {a: 1, b: 2, c: 3}
+
+
+def test_template_attributes():
+    dag = Dagather()
+
+    async def a(x):
+        """
+        the a docstring
+        """
+
+    a.foo = 'bar'
+    template = dag.register(a)
+
+    assert template.__name__ == 'a'
+    assert template.__qualname__ == a.__qualname__
+    assert template.__doc__ == a.__doc__
+    assert 'sub-task' in type(template).__doc__
+    assert template.__wrapped__ is a
+    assert template.foo == 'bar'
+    assert list(signature(template).parameters) == ['x']
+    with raises(AttributeError):
+        template.foo = 'baz'
+    assert ref(template)() is template
+
+
 @atest
 async def test_call_template():
     dag = Dagather()
@@ -223,7 +512,8 @@ async def test_error_no_rollback():
     assert ex == ['a']
 
 
-def make_error_prone(handler):
+@fixture(scope='module')
+def error_prone_dag():
     dag = Dagather()
 
     ex = []
@@ -233,7 +523,7 @@ def make_error_prone(handler):
     async def a():
         ex.append('a')
 
-    @dag.register(exception_handler=handler)
+    @dag.register
     async def b(a):
         ex2.append('b0')
         raise ValueError('foobar')
@@ -255,8 +545,34 @@ def make_error_prone(handler):
     return dag, ex, ex2, (a, b, c, d, e)
 
 
+@fixture
+def make_error_prone(error_prone_dag):
+    dag, ex, ex2, templates = error_prone_dag
+    # the dagather is shared between tests, so each test starts with fresh logs
+    ex.clear()
+    ex2.clear()
+
+    def make(handler):
+        templates[1].exception_handler = handler
+        return error_prone_dag
+
+    return make
+
+
+def test_exception_handler_identity():
+    assert PropagateError.exception_handler(CancelPolicy.continue_all) \
+        is PropagateError.exception_handler(CancelPolicy.continue_all)
+    assert PropagateError.exception_handler(CancelPolicy.continue_all) \
+        is not ContinueResult.exception_handler(CancelPolicy.continue_all)
+    assert ContinueResult(None, 2).cancel_policy is CancelPolicy.discard_not_started
+    with raises(ValueError):
+        PropagateError(ValueError(), 'cancel_all')
+    assert ContinueResult.exception_handler(2).keywords['cancel_policy'] is CancelPolicy.discard_not_started
+    assert ContinueResult.exception_handler(2) is ContinueResult.exception_handler(CancelPolicy.discard_not_started)
+
+
 @atest
-async def test_error_cancels():
+async def test_error_cancels(make_error_prone):
     dag, ex1, ex2, _ = make_error_prone(PropagateError.exception_handler(CancelPolicy.discard_not_started))
 
     with raises(ValueError, match='foobar'):
@@ -267,7 +583,7 @@ async def test_error_cancels():
 
 
 @atest
-async def test_return_errors():
+async def test_return_errors(make_error_prone):
     dag, ex1, ex2, (a, b, c, d, e) = make_error_prone(
         ContinueResult.exception_handler(CancelPolicy.discard_not_started))
 
@@ -280,7 +596,7 @@ async def test_return_errors():
 
 
 @atest
-async def test_return_errors_continue():
+async def test_return_errors_continue(make_error_prone):
     dag, ex1, ex2, (a, b, c, d, e) = make_error_prone(ContinueResult.exception_handler(CancelPolicy.continue_all))
 
     result = await dag()
@@ -292,7 +608,7 @@ async def test_return_errors_continue():
 
 
 @atest
-async def test_return_errors_cancel_branch():
+async def test_return_errors_cancel_branch(make_error_prone):
     dag, ex1, ex2, (a, b, c, d, e) = make_error_prone(ContinueResult.exception_handler(CancelPolicy.discard_children))
 
     result = await dag()
@@ -304,7 +620,7 @@ async def test_return_errors_cancel_branch():
 
 
 @atest
-async def test_raise_continue():
+async def test_raise_continue(make_error_prone):
     dag, ex1, ex2, _ = make_error_prone(PropagateError.exception_handler(CancelPolicy.continue_all))
 
     with raises(ValueError, match='foobar'):
@@ -315,7 +631,7 @@ async def test_raise_continue():
 
 
 @atest
-async def test_raise_cancel_branch():
+async def test_raise_cancel_branch(make_error_prone):
     dag, ex1, ex2, _ = make_error_prone(PropagateError.exception_handler(CancelPolicy.discard_children))
 
     with raises(ValueError, match='foobar'):
@@ -393,7 +709,8 @@ async def test_cancel_from_sibling():
 
 
 @atest
-async def test_cancel_all():
+@mark.parametrize('cancel_policy', [CancelPolicy.cancel_all, int(CancelPolicy.cancel_all)])
+async def test_cancel_all(cancel_policy):
     dag = Dagather(default_exception_handler={
         CancelledError: ContinueResult('cancelled')
     })
@@ -412,7 +729,7 @@ async def test_cancel_all():
 
     @dag.register
     async def d():
-        raise Abort(ContinueResult(None, CancelPolicy.cancel_all))
+        raise Abort(ContinueResult(None, cancel_policy))
 
     assert await dag() == {
         a: 'cancelled',
@@ -421,6 +738,32 @@ async def test_cancel_all():
     }
 
 
+@atest
+async def test_cancel_all_independent():
+    dag = Dagather(default_exception_handler={
+        CancelledError: ContinueResult('cancelled')
+    })
+
+    @dag.register
+    async def a():
+        await sleep(0.10)
+
+    @dag.register
+    async def b():
+        await sleep(0.01)
+        raise Abort(ContinueResult(None, CancelPolicy.cancel_all))
+
+    @dag.register
+    async def c():
+        return 'cyan'
+
+    assert await dag() == {
+        a: 'cancelled',
+        b: None,
+        c: 'cyan'
+    }
+
+
 @atest
 async def test_sibling_introspection():
     dag = Dagather()
@@ -463,6 +806,83 @@ async def test_sibling_introspection():
         x = result[b]
 
 
+@atest
+@mark.parametrize('independent', [True, False])
+async def test_sibling_task_result(independent):
+    dag = Dagather()
+
+    @dag.register
+    async def a():
+        return 'apple'
+
+    @dag.register
+    async def b():
+        raise Abort(ContinueResult('banana'))
+
+    @dag.register
+    async def c():
+        await sleep(0.01)
+        return (await sibling_tasks.get().task(a), await sibling_tasks.get().task(b))
+
+    if not independent:
+        @dag.register
+        async def d(a):
+            return a * 2
+
+    result = await dag()
+    assert result[c] == ('apple', ContinueResult('banana'))
+    assert result.tasks[a].result() == 'apple'
+    assert result[b] == 'banana'
+
+
+@atest
+@mark.parametrize('independent', [True, False])
+async def test_sibling_cancel_not_started(independent):
+    dag = Dagather()
+
+    @dag.register
+    async def a():
+        # b has been created, but has not started yet
+        sibling_tasks.get().cancel(b)
+
+    @dag.register
+    async def b():
+        pass
+
+    if not independent:
+        @dag.register
+        async def c(a):
+            pass
+
+    with raises(CancelledError):
+        await dag()
+
+
+@atest
+async def test_sibling_foreign_template():
+    other = Dagather()
+
+    @other.register
+    async def z():
+        pass
+
+    dag = Dagather()
+
+    @dag.register
+    async def x():
+        await sleep(0.01)
+        sibling_tasks.get().cancel(z)
+        assert sibling_tasks.get().state_of(z) == SiblingTaskState.waiting
+        assert sibling_tasks.get().state_of(y) == SiblingTaskState.waiting
+        return 'xenon'
+
+    @dag.register
+    async def y(x):
+        return 'yttrium'
+
+    assert await dag() == {x: 'xenon', y: 'yttrium'}
+
+
 @atest
 async def test_discard_sibling():
     dag = Dagather()
@@ -494,6 +914,106 @@ async def test_discard_sibling():
     assert result.discarded == {b, d}
 
 
+@atest
+async def test_discard_deep():
+    dag = Dagather()
+    templates = []
+
+    @dag.register
+    async def t0():
+        raise Abort(ContinueResult(None, CancelPolicy.discard_children))
+
+    for i in range(1, 2000):
+        async def t(**kwargs):
+            pass
+
+        t.__name__ = f't{i}'
+        t.__signature__ = Signature([Parameter(f't{i - 1}', Parameter.KEYWORD_ONLY)])
+        templates.append(dag.register(t))
+
+    result = await dag()
+    assert result == {t0: None}
+    assert result.discarded == set(templates)
+
+
+@atest
+async def test_handler_mapping():
+    handler = {
+        (KeyError, IndexError): ContinueResult('lookup'),
+        Exception: lambda e: {ValueError: ContinueResult('value')},
+        ValueError: ContinueResult('unreachable'),
+        BaseException: ContinueResult('base'),
+    }
+    dag = Dagather(default_exception_handler=handler)
+
+    @dag.register
+    async def a():
+        raise KeyError
+
+    @dag.register
+    async def b():
+        raise ValueError
+
+    @dag.register
+    async def c():
+        raise BaseException
+
+    assert await dag() == {a: 'lookup', b: 'value', c: 'base'}
+    assert await dag() == {a: 'lookup', b: 'value', c: 'base'}
+
+    a.exception_handler = {KeyError: ContinueResult('key')}
+    assert await dag() == {a: 'key', b: 'value', c: 'base'}
+
+    # mapping handlers are copied when assigned
+    a.exception_handler[KeyError] = ContinueResult('ignored')
+    assert await dag() == {a: 'key', b: 'value', c: 'base'}
+    a.exception_handler = a.exception_handler
+    assert await dag() == {a: 'ignored', b: 'value', c: 'base'}
+
+    dag = Dagather(default_exception_handler=handler)
+
+    @dag.register
+    async def d():
+        raise TypeError
+
+    with raises(TypeError):
+        await dag()
+
+
+@atest
+async def test_handler_types():
+    class Handler:
+        def __call__(self, e):
+            return MappingProxyType({KeyError: ContinueResult('key')})
+
+    dag = Dagather(default_exception_handler=Handler())
+
+    @dag.register
+    async def a():
+        raise KeyError
+
+    @dag.register
+    async def b():
+        return 'bell'
+
+    assert await dag() == {a: 'key', b: 'bell'}
+    assert await dag() == {a: 'key', b: 'bell'}
+
+
+def test_handler_types_released():
+    class Handler:
+        def __call__(self, e):
+            return ContinueResult('key')
+
+    assert handle_exception(Handler(), KeyError()) == ContinueResult('key')
+
+    # remembering the handler's type does not keep it alive
+    handler_type = ref(Handler)
+    del Handler
+    collect()
+    assert handler_type() is None
+
+
 @atest
 async def test_propagate_base():
     dag = Dagather()